@@ -0,0 +1,74 @@
+import streamlit as st
+import google.generativeai as genai
+from PIL import Image
+import numpy as np
+import os
+import tempfile
+
+# --- 圖片/攝影輸入處理 ---
+# 每張照片只解碼一次，並以感知雜湊 (dHash) 判斷是否與上一張照片為相同場景；
+# 相同場景直接沿用上一張照片，不再重複上傳 (介面上會註明沿用)。
+SAME_SCENE_MAX_DISTANCE = 5
+RECENT_FRAMES = 4
+
+def perceptual_hash(image):
+    """dHash：縮成 9x8 灰階後比較左右相鄰像素的亮度，回傳 64 個布林值。"""
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.Resampling.BILINEAR), dtype=np.int16)
+    return (pixels[:, 1:] > pixels[:, :-1]).ravel()
+
+def hash_distance(a, b):
+    return int(np.count_nonzero(a != b))
+
+def load_capture(source, uploaded_file, seen_file_ids, recent_frames):
+    """只在出現新的拍照/上傳時解碼圖片，回傳 (frame, 是否沿用上一張)；沒有新圖片時回傳 (None, False)。
+
+    只和上一張比較，較早的照片即使相似也不會取代新拍的照片。
+    """
+    if uploaded_file is None or seen_file_ids.get(source) == uploaded_file.file_id:
+        return None, False
+    seen_file_ids[source] = uploaded_file.file_id
+    image = Image.open(uploaded_file)
+    image.load()
+    image_hash = perceptual_hash(image)
+    if recent_frames and hash_distance(recent_frames[-1]["hash"], image_hash) <= SAME_SCENE_MAX_DISTANCE:
+        # 相同場景：沿用上一張 frame (含已上傳的檔案)
+        return recent_frames[-1], True
+    if len(recent_frames) == recent_frames.maxlen:
+        release_frame(recent_frames.popleft())
+    frame = {"image": image, "hash": image_hash, "sends": 0, "file": None, "inline_only": False}
+    recent_frames.append(frame)
+    return frame, False
+
+def model_part(frame):
+    """回傳要送給模型的圖片內容。
+
+    第一次送出時直接附上圖片，省下上傳的往返；同一張照片再次送出時才上傳到 File API，之後沿用同一個檔案。
+    """
+    frame["sends"] += 1
+    if frame["file"] is not None:
+        return frame["file"]
+    if frame["sends"] == 1 or frame["inline_only"] or os.environ.get("GEMINI_FAKE_MODEL"):
+        return frame["image"]
+    # upload_file 只接受檔案路徑，先寫入暫存檔 (關閉後再上傳，Windows 上才能再次開啟)
+    with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as temp_file:
+        frame["image"].convert("RGB").save(temp_file, format="JPEG")
+    try:
+        frame["file"] = genai.upload_file(temp_file.name, mime_type="image/jpeg")
+    except Exception as e:
+        frame["inline_only"] = True
+        st.warning(f"圖片上傳失敗，改為直接附上圖片：{e}")
+        return frame["image"]
+    finally:
+        os.remove(temp_file.name)
+    return frame["file"]
+
+def release_frame(frame):
+    """照片移出緩衝區時刪除已上傳的檔案，避免 File API 的檔案不斷累積。"""
+    if frame["file"] is None:
+        return
+    try:
+        genai.delete_file(frame["file"].name)
+    except Exception:
+        # 刪除失敗不影響對話，檔案 48 小時後也會自動過期
+        pass
+    frame["file"] = None
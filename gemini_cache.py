@@ -0,0 +1,177 @@
+import google.generativeai as genai
+from google.generativeai import caching
+from google.api_core.exceptions import NotFound, PermissionDenied
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import hashlib
+
+# --- 伺服器端快取 (Context Caching) ---
+# 較長的角色描述與共用參考文件只向 Gemini 登記一次，之後以快取代號 (handle) 引用，
+# 避免每一輪對話都重新計算並計費相同的輸入 token。
+CACHE_TTL = timedelta(minutes=30)
+CACHE_REFRESH_MARGIN = timedelta(minutes=5)
+# 各模型建立快取所需的最少 token 數，不足時改用一般的 system_instruction
+CACHE_MIN_TOKENS = {"gemini-2.5-flash": 1024, "gemini-2.5-pro": 4096}
+# 建立快取失敗後，等待這段時間才再次嘗試，避免每次重新執行都呼叫 API
+CACHE_RETRY_AFTER = timedelta(minutes=10)
+
+def utc_now():
+    return datetime.now(timezone.utc)
+
+def persona_hash(persona_prompt: str, documents: list) -> str:
+    digest = hashlib.sha256(persona_prompt.strip().encode("utf-8"))
+    for document in documents:
+        digest.update(b"\0")
+        digest.update(document.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def cache_key(api_key: str, model_name: str, persona_prompt: str, documents: list) -> tuple:
+    # 快取屬於建立它的 API Key 所在的專案，不同金鑰的 session 不能共用同一個代號
+    key_digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    return (key_digest, model_name, persona_hash(persona_prompt, documents))
+
+class GeminiCacheBackend:
+    """透過 Gemini 的 cached-content API 建立、延長與使用快取。"""
+
+    def count_tokens(self, model_name, system_instruction, documents):
+        model = genai.GenerativeModel(model_name=model_name)
+        return model.count_tokens([system_instruction, *documents]).total_tokens
+
+    def create(self, model_name, display_name, system_instruction, documents, ttl):
+        cache = caching.CachedContent.create(
+            model=model_name,
+            display_name=display_name,
+            system_instruction=system_instruction,
+            contents=documents or None,
+            ttl=ttl,
+        )
+        return cache, cache.expire_time
+
+    def refresh(self, handle, ttl):
+        handle.update(ttl=ttl)
+        return handle.expire_time
+
+    def model_for(self, handle):
+        return genai.GenerativeModel.from_cached_content(cached_content=handle)
+
+class FakeCachedChat:
+    def __init__(self, backend, handle):
+        self.backend = backend
+        self.handle = handle
+
+    def send_message(self, content):
+        cache = self.backend.get(self.handle)
+        cached_tokens = self.backend.count_tokens(cache["model"], cache["system_instruction"], cache["documents"])
+        prompt_tokens = len(content) if isinstance(content, str) else 0
+        return SimpleNamespace(
+            text=f"（{cache['display_name']} 模擬回覆）{content}",
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=cached_tokens + prompt_tokens,
+                cached_content_token_count=cached_tokens,
+            ),
+        )
+
+class FakeCachedModel:
+    def __init__(self, backend, handle):
+        self.backend = backend
+        self.cached_content = handle
+
+    def start_chat(self, history=None):
+        return FakeCachedChat(self.backend, self.cached_content)
+
+class FakeCacheBackend:
+    """在記憶體中模擬 cached-content API，不需網路與 API Key (設定環境變數 GEMINI_FAKE_CACHE=1 啟用)。
+
+    token 數以字元數估算。和真正的 API 一樣，model_for 不會檢查快取是否存在，
+    快取過期或被刪除時要到 send_message 或 refresh 才會拋出 NotFound。
+    """
+
+    def __init__(self, clock=utc_now):
+        self.clock = clock
+        self.caches = {}
+        self.created = 0
+        self.refreshed = 0
+
+    def count_tokens(self, model_name, system_instruction, documents):
+        return len(system_instruction) + sum(len(document) for document in documents)
+
+    def create(self, model_name, display_name, system_instruction, documents, ttl):
+        self.created += 1
+        name = f"cachedContents/fake-{self.created}"
+        expire_time = self.clock() + ttl
+        self.caches[name] = {
+            "model": model_name,
+            "display_name": display_name,
+            "system_instruction": system_instruction,
+            "documents": list(documents),
+            "expire_time": expire_time,
+        }
+        return name, expire_time
+
+    def get(self, handle):
+        cache = self.caches.get(handle)
+        if cache is None or cache["expire_time"] <= self.clock():
+            self.caches.pop(handle, None)
+            raise NotFound(f"快取不存在或已過期：{handle}")
+        return cache
+
+    def delete(self, handle):
+        self.caches.pop(handle, None)
+
+    def refresh(self, handle, ttl):
+        cache = self.get(handle)
+        self.refreshed += 1
+        cache["expire_time"] = self.clock() + ttl
+        return cache["expire_time"]
+
+    def model_for(self, handle):
+        return FakeCachedModel(self, handle)
+
+def get_cached_model(backend, registry, api_key, model_name, persona_prompt, documents, now=None):
+    """回傳使用快取的模型；內容太短或建立快取失敗時回傳 None，由呼叫端改用 system_instruction。
+
+    失敗原因記錄在登記表中 (見 cache_entry)。延長快取時的暫時性錯誤會直接拋出，保留原本的登記。
+    """
+    key = cache_key(api_key, model_name, persona_prompt, documents)
+    entry = registry.get(key)
+    now = now or utc_now()
+    if entry is not None:
+        if entry["handle"] is None:
+            if entry["retry_after"] is None or now < entry["retry_after"]:
+                return None
+        elif entry["expire_time"] > now:
+            try:
+                if entry["expire_time"] - now <= CACHE_REFRESH_MARGIN:
+                    entry["expire_time"] = backend.refresh(entry["handle"], CACHE_TTL)
+                return backend.model_for(entry["handle"])
+            except (NotFound, PermissionDenied):
+                # 快取已在伺服器端被刪除，重新建立
+                pass
+        registry.pop(key, None)
+
+    try:
+        tokens = backend.count_tokens(model_name, persona_prompt, documents)
+        if tokens < CACHE_MIN_TOKENS.get(model_name, 4096):
+            registry[key] = {"handle": None, "expire_time": None, "retry_after": None, "error": None, "tokens": tokens}
+            return None
+        handle, expire_time = backend.create(model_name, f"persona-{key[2]}", persona_prompt, documents, CACHE_TTL)
+    except Exception as e:
+        registry[key] = {"handle": None, "expire_time": None, "retry_after": now + CACHE_RETRY_AFTER, "error": str(e),
+                      "tokens": None}
+        return None
+    registry[key] = {"handle": handle, "expire_time": expire_time, "retry_after": None, "error": None,
+                     "tokens": tokens}
+    return backend.model_for(handle)
+
+def cache_entry(registry, api_key, model_name, persona_prompt, documents):
+    return registry.get(cache_key(api_key, model_name, persona_prompt, documents))
+
+def drop_cached_model(registry, api_key, model_name, persona_prompt, documents):
+    # 從快取模型建立物件不會呼叫 API，伺服器端快取失效要到送出訊息時才會發現
+    registry.pop(cache_key(api_key, model_name, persona_prompt, documents), None)
+
+def build_uncached_model(model_name, persona_prompt, documents):
+    return genai.GenerativeModel(
+        model_name=model_name,
+        system_instruction="\n\n".join([persona_prompt, *documents])
+    )
@@ -0,0 +1,179 @@
+import google.generativeai as genai
+import os
+import queue
+import random
+import statistics
+import threading
+import time
+from types import SimpleNamespace
+
+# --- 模型路由與備援請求 (Hedging) ---
+AUTO_ROUTE = "自動路由"
+FAST_MODEL = "gemini-2.5-flash"
+# latency：一般首字延遲 (秒)；cost：每百萬輸入 token 的約略價格 (美元)
+MODEL_PROFILES = {
+    "gemini-2.5-flash": {"latency": 1.0, "cost": 0.30},
+    "gemini-1.5-pro": {"latency": 3.0, "cost": 1.25},
+}
+# 備援請求的等待時間 = 主要模型一般首字延遲 x 倍數；應落在延遲的長尾而非中位數，避免每一輪都重複請求
+HEDGE_LATENCY_FACTOR = 2.0
+# 被放棄的請求無法從用戶端取消，以請求逾時 (秒) 限制它最多佔用連線與執行緒多久
+HEDGE_REQUEST_TIMEOUT = 120
+# 依序比對，第一條符合的規則決定模型；都不符合時使用 FAST_MODEL
+ROUTING_RULES = [
+    ("含圖片", lambda prompt, has_image, persona: has_image, "gemini-1.5-pro"),
+    ("長提問", lambda prompt, has_image, persona: len(prompt) > 500, "gemini-1.5-pro"),
+    ("長角色描述", lambda prompt, has_image, persona: len(persona) > 2000, "gemini-1.5-pro"),
+]
+
+def route_model(prompt, has_image, persona, max_latency, max_cost):
+    """回傳 (模型名稱, 路由原因)。規則選中的模型超出延遲或成本目標時改用快速模型。"""
+    for reason, matches, candidate in ROUTING_RULES:
+        if matches(prompt, has_image, persona):
+            profile = MODEL_PROFILES[candidate]
+            if profile["latency"] <= max_latency and profile["cost"] <= max_cost:
+                return candidate, reason
+            return FAST_MODEL, f"{reason} (超出延遲/成本目標)"
+    return FAST_MODEL, "預設"
+
+# 假模型伺服器：設定環境變數 GEMINI_FAKE_MODEL=1 後不呼叫真正的 API，
+# 以 MODEL_PROFILES 的延遲模擬串流回覆，並有一定機率出現長尾延遲，用來量測路由與備援效果。
+FAKE_TAIL_RATE = 0.2
+FAKE_TAIL_FACTOR = 5
+FAKE_CHUNK_DELAY = 0.05
+
+class FakeChat:
+    """模擬串流回覆。首字延遲在建立時就以 rng 抽出，傳入固定種子的 rng 即可重現結果；
+    time_scale 會等比例縮放所有延遲，方便快速量測。"""
+
+    def __init__(self, model_name, rng=random, time_scale=1.0):
+        self.model_name = model_name
+        self.time_scale = time_scale
+        self.first_token_delay = MODEL_PROFILES.get(model_name, {"latency": 1.0})["latency"] * time_scale
+        if rng.random() < FAKE_TAIL_RATE:
+            self.first_token_delay *= FAKE_TAIL_FACTOR
+
+    def _chunks(self, content):
+        time.sleep(self.first_token_delay)
+        prompt = content[0] if isinstance(content, list) else content
+        text = f"（{self.model_name} 模擬回覆）您說的是：{prompt}"
+        for i in range(0, len(text), 8):
+            time.sleep(FAKE_CHUNK_DELAY * self.time_scale)
+            yield SimpleNamespace(text=text[i:i + 8])
+
+    def send_message(self, content, stream=False, request_options=None):
+        chunks = self._chunks(content)
+        if stream:
+            return chunks
+        return SimpleNamespace(text="".join(chunk.text for chunk in chunks))
+
+def make_chat(name, persona):
+    if os.environ.get("GEMINI_FAKE_MODEL"):
+        return FakeChat(name)
+    model = genai.GenerativeModel(model_name=name, system_instruction=persona)
+    return model.start_chat(history=[])
+
+def _stream_worker(name, chat, model_input, events, abandoned):
+    # 在背景執行緒中讀取串流，只透過 queue 回傳結果，不呼叫任何 st.* 函數。
+    # abandoned 只能在收到下一段文字時檢查；在此之前請求會持續進行，直到 HEDGE_REQUEST_TIMEOUT。
+    try:
+        stream = chat.send_message(model_input, stream=True,
+                                   request_options={"timeout": HEDGE_REQUEST_TIMEOUT})
+        for chunk in stream:
+            if abandoned.is_set():
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+                return
+            events.put((name, "chunk", chunk.text))
+        events.put((name, "done", None))
+    except Exception as e:
+        events.put((name, "error", e))
+
+def hedged_send(chats, primary, backup, model_input, deadline):
+    """逐段產生 (回覆的模型, 文字)。
+
+    先送出主要請求；若 deadline 秒內仍未收到第一段文字 (或主要請求失敗)，
+    再向 backup 模型送出相同請求。先回覆的一方勝出，另一方被放棄：不再讀取它的串流，
+    但伺服器端的請求不會被取消，仍可能計費，直到它結束或逾時。
+    """
+    events = queue.Queue()
+    abandoned = {}
+    running = set()
+
+    def launch(name):
+        abandoned[name] = threading.Event()
+        running.add(name)
+        threading.Thread(
+            target=_stream_worker,
+            args=(name, chats(name), model_input, events, abandoned[name]),
+            daemon=True
+        ).start()
+
+    def abandon_others(name):
+        for other, event in abandoned.items():
+            if other != name:
+                event.set()
+                running.discard(other)
+
+    launch(primary)
+    started_at = time.monotonic()
+    winner = None
+    last_error = None
+    while running:
+        timeout = None
+        if winner is None and backup and backup not in abandoned:
+            timeout = max(0.0, deadline - (time.monotonic() - started_at))
+        try:
+            name, kind, payload = events.get(timeout=timeout)
+        except queue.Empty:
+            launch(backup)
+            continue
+        if winner is not None and name != winner:
+            continue
+        if kind == "chunk":
+            if winner is None:
+                winner = name
+                abandon_others(name)
+            yield name, payload
+        elif kind == "done":
+            # 沒有任何文字就完成 (空白回覆) 也視為勝出
+            abandon_others(name)
+            return
+        else:
+            running.discard(name)
+            last_error = payload
+            if winner is not None:
+                raise payload
+            if backup and backup not in abandoned:
+                launch(backup)
+    if last_error is not None:
+        raise last_error
+
+def benchmark_hedging(turns=200, seed=0, hedge=True, primary="gemini-1.5-pro", time_scale=0.01):
+    """以假模型跑 turns 輪 hedged_send，回傳首字延遲 (秒，已換算回未縮放的時間) 的 p50/p99 與備援勝出比例。"""
+    rng = random.Random(seed)
+    backup = FAST_MODEL if hedge and primary != FAST_MODEL else None
+    deadline = HEDGE_LATENCY_FACTOR * MODEL_PROFILES[primary]["latency"] * time_scale
+    latencies = []
+    backup_wins = 0
+    for _ in range(turns):
+        started_at = time.monotonic()
+        for answered_model, _text in hedged_send(
+            lambda name: FakeChat(name, rng=rng, time_scale=time_scale),
+            primary, backup, ["你好"], deadline
+        ):
+            latencies.append((time.monotonic() - started_at) / time_scale)
+            backup_wins += answered_model != primary
+            break
+    return {
+        "p50": statistics.median(latencies),
+        "p99": statistics.quantiles(latencies, n=100)[98],
+        "backup_rate": backup_wins / turns,
+    }
+
+if __name__ == "__main__":
+    for hedge in (False, True):
+        result = benchmark_hedging(hedge=hedge)
+        label = "有備援" if hedge else "無備援"
+        print(f"{label}：p50 {result['p50']:.2f} 秒，p99 {result['p99']:.2f} 秒，備援勝出 {result['backup_rate']:.0%}")
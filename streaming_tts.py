@@ -0,0 +1,103 @@
+import streamlit as st
+from gtts import gTTS
+import io
+import base64
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- 串流語音：逐句合成並依序無縫播放 ---
+# 句尾標點 (英文句點需接空白，避免切到小數點)
+SENTENCE_END = re.compile(r"[。！？!?；;\n]|\.(?=\s)")
+# 太短的句子先併入下一句，減少語音請求次數
+MIN_SENTENCE_CHARS = 6
+
+# 播放佇列與播放函數建立在父頁面 (window.parent) 上，元件 iframe 被移除後仍會繼續播放
+AUDIO_QUEUE_HTML = """
+<script>
+const host = window.parent;
+if (!host.ttsPlayNext) {
+    host.ttsQueue = [];
+    host.ttsPlayNext = new host.Function(`
+        const audio = window.ttsQueue.shift();
+        window.ttsPlaying = Boolean(audio);
+        if (!audio) return;
+        // onerror 與 play() 的 catch 可能同時觸發，每個片段只能推進佇列一次
+        let advanced = false;
+        const advance = () => {
+            if (advanced) return;
+            advanced = true;
+            window.ttsPlayNext();
+        };
+        audio.onended = advance;
+        audio.onerror = advance;
+        audio.play().catch(advance);
+    `);
+}
+const audio = new host.Audio("data:audio/mp3;base64,__AUDIO_BASE64__");
+audio.preload = "auto";
+host.ttsQueue.push(audio);
+if (!host.ttsPlaying) host.ttsPlayNext();
+</script>
+"""
+
+@st.cache_resource
+def get_tts_executor():
+    return ThreadPoolExecutor(max_workers=3)
+
+def synthesize_speech(text: str, language_tld: str) -> bytes:
+    tts = gTTS(text=text, lang='zh-TW', tld=language_tld, slow=False)
+    audio_fp = io.BytesIO()
+    tts.write_to_fp(audio_fp)
+    return audio_fp.getvalue()
+
+def play_audio_queued(audio_bytes: bytes):
+    audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
+    st.components.v1.html(AUDIO_QUEUE_HTML.replace("__AUDIO_BASE64__", audio_base64), height=0)
+
+class StreamingSpeaker:
+    """把串流回覆切成句子，每完成一句就在背景合成語音，並依原順序加入播放佇列。"""
+
+    def __init__(self, language_tld: str, started_at: float = None):
+        self.language_tld = language_tld
+        # first_audio_latency 從 started_at 起算，預設為建立時
+        self.started_at = time.monotonic() if started_at is None else started_at
+        self.buffer = ""
+        self.pending = []
+        self.first_audio_latency = None
+
+    def feed(self, text: str):
+        self.buffer += text
+        while (cut := self._sentence_end()) is not None:
+            self._submit(self.buffer[:cut])
+            self.buffer = self.buffer[cut:]
+        self._play_ready()
+
+    def finish(self):
+        self._submit(self.buffer)
+        self.buffer = ""
+        self._play_ready(wait=True)
+
+    def _sentence_end(self):
+        for match in SENTENCE_END.finditer(self.buffer):
+            if len(self.buffer[:match.end()].strip()) >= MIN_SENTENCE_CHARS:
+                return match.end()
+        return None
+
+    def _submit(self, sentence: str):
+        sentence = sentence.strip()
+        # 只有標點或空白的片段無法合成語音
+        if any(ch.isalnum() for ch in sentence):
+            self.pending.append(get_tts_executor().submit(synthesize_speech, sentence, self.language_tld))
+
+    def _play_ready(self, wait=False):
+        # 只播放排在最前面且已完成的片段，確保播放順序與文字順序一致
+        while self.pending and (wait or self.pending[0].done()):
+            future = self.pending.pop(0)
+            try:
+                play_audio_queued(future.result())
+            except Exception as e:
+                st.error(f"語音生成失敗：{e}")
+                continue
+            if self.first_audio_latency is None:
+                self.first_audio_latency = time.monotonic() - self.started_at
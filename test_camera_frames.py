@@ -0,0 +1,73 @@
+import io
+from collections import deque
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import camera_frames
+from camera_frames import RECENT_FRAMES, load_capture, model_part
+
+
+def capture(file_id, seed):
+    pixels = np.random.default_rng(seed).integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    data = io.BytesIO()
+    Image.fromarray(pixels).save(data, format="PNG")
+    data.seek(0)
+    data.file_id = file_id
+    return data
+
+
+@pytest.fixture
+def file_api(monkeypatch):
+    monkeypatch.delenv("GEMINI_FAKE_MODEL", raising=False)
+    api = SimpleNamespace(uploaded=[], deleted=[])
+
+    def upload_file(path, mime_type=None):
+        api.uploaded.append(path)
+        return SimpleNamespace(name=f"files/{len(api.uploaded)}")
+
+    monkeypatch.setattr(camera_frames.genai, "upload_file", upload_file)
+    monkeypatch.setattr(camera_frames.genai, "delete_file", api.deleted.append)
+    return api
+
+
+def test_image_is_sent_inline_first_and_uploaded_only_when_reused(file_api):
+    frame, _reused = load_capture("camera", capture("a", 0), {}, deque(maxlen=RECENT_FRAMES))
+
+    assert model_part(frame) is frame["image"]
+    assert file_api.uploaded == []
+    first_upload = model_part(frame)
+    assert model_part(frame) is first_upload
+    assert len(file_api.uploaded) == 1
+
+
+def test_evicted_frames_delete_their_uploads(file_api):
+    seen, recent = {}, deque(maxlen=RECENT_FRAMES)
+    oldest, _reused = load_capture("camera", capture("a", 0), seen, recent)
+    model_part(oldest)
+    uploaded = model_part(oldest)
+
+    for seed in range(1, RECENT_FRAMES + 1):
+        load_capture("camera", capture(f"f{seed}", seed), seen, recent)
+
+    assert oldest not in recent
+    assert file_api.deleted == [uploaded.name]
+    assert len(recent) == RECENT_FRAMES
+
+
+def test_only_the_previous_frame_is_reused():
+    seen, recent = {}, deque(maxlen=RECENT_FRAMES)
+    first, _reused = load_capture("camera", capture("a", 0), seen, recent)
+    load_capture("camera", capture("b", 1), seen, recent)
+
+    again, reused = load_capture("camera", capture("c", 0), seen, recent)
+    assert not reused
+    assert again is not first
+
+    same, reused = load_capture("camera", capture("d", 0), seen, recent)
+    assert reused
+    assert same is again
+    assert len(recent) == 3
+    assert load_capture("camera", None, seen, recent) == (None, False)
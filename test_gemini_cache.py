@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from google.api_core.exceptions import NotFound, ServiceUnavailable
+
+from gemini_cache import (
+    CACHE_MIN_TOKENS,
+    CACHE_REFRESH_MARGIN,
+    CACHE_RETRY_AFTER,
+    CACHE_TTL,
+    FakeCacheBackend,
+    cache_entry,
+    cache_key,
+    drop_cached_model,
+    get_cached_model,
+)
+
+MODEL = "gemini-2.5-flash"
+LONG_PERSONA = "汪" * (CACHE_MIN_TOKENS[MODEL] + 1)
+SHORT_PERSONA = "你是一隻黃金獵犬。"
+
+
+class Clock:
+    def __init__(self):
+        self.now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def backend(clock):
+    return FakeCacheBackend(clock=clock)
+
+
+def cached_model(backend, registry, clock, persona=LONG_PERSONA, api_key="key-a"):
+    return get_cached_model(backend, registry, api_key, MODEL, persona, [], now=clock())
+
+
+def test_below_minimum_falls_back_without_recounting(backend, clock):
+    registry = {}
+    calls = []
+    count_tokens = backend.count_tokens
+    backend.count_tokens = lambda *args: calls.append(args) or count_tokens(*args)
+
+    assert cached_model(backend, registry, clock, persona=SHORT_PERSONA) is None
+    assert cached_model(backend, registry, clock, persona=SHORT_PERSONA) is None
+    assert backend.created == 0
+    assert len(calls) == 1
+
+
+def test_reuses_registered_cache(backend, clock):
+    registry = {}
+    first = cached_model(backend, registry, clock)
+    clock.now += timedelta(minutes=1)
+    second = cached_model(backend, registry, clock)
+
+    assert backend.created == 1
+    assert backend.refreshed == 0
+    assert first.cached_content == second.cached_content
+    usage = second.start_chat().send_message("你好").usage_metadata
+    assert usage.cached_content_token_count == len(LONG_PERSONA)
+
+
+def test_refreshes_inside_margin(backend, clock):
+    registry = {}
+    cached_model(backend, registry, clock)
+    clock.now += CACHE_TTL - CACHE_REFRESH_MARGIN + timedelta(seconds=1)
+    cached_model(backend, registry, clock)
+
+    entry = registry[cache_key("key-a", MODEL, LONG_PERSONA, [])]
+    assert backend.created == 1
+    assert backend.refreshed == 1
+    assert entry["expire_time"] == clock.now + CACHE_TTL
+
+
+def test_recreates_after_expiry(backend, clock):
+    registry = {}
+    first = cached_model(backend, registry, clock)
+    clock.now += CACHE_TTL + timedelta(seconds=1)
+    second = cached_model(backend, registry, clock)
+
+    assert backend.created == 2
+    assert first.cached_content != second.cached_content
+    with pytest.raises(NotFound):
+        first.start_chat().send_message("你好")
+    second.start_chat().send_message("你好")
+
+
+def test_caches_are_scoped_to_api_key(backend, clock):
+    registry = {}
+    first = cached_model(backend, registry, clock, api_key="key-a")
+    second = cached_model(backend, registry, clock, api_key="key-b")
+
+    assert backend.created == 2
+    assert first.cached_content != second.cached_content
+
+
+def test_dropped_entry_is_recreated_after_server_side_delete(backend, clock):
+    registry = {}
+    model = cached_model(backend, registry, clock)
+    backend.delete(model.cached_content)
+    with pytest.raises(NotFound):
+        model.start_chat().send_message("你好")
+
+    drop_cached_model(registry, "key-a", MODEL, LONG_PERSONA, [])
+    recreated = cached_model(backend, registry, clock)
+    assert backend.created == 2
+    recreated.start_chat().send_message("你好")
+
+
+def test_failed_create_backs_off_before_retrying(backend, clock):
+    registry = {}
+    calls = []
+
+    def failing_create(*args):
+        calls.append(args)
+        raise ServiceUnavailable("quota")
+
+    create = backend.create
+    backend.create = failing_create
+    assert cached_model(backend, registry, clock) is None
+    clock.now += timedelta(minutes=1)
+    assert cached_model(backend, registry, clock) is None
+    assert len(calls) == 1
+    assert "quota" in cache_entry(registry, "key-a", MODEL, LONG_PERSONA, [])["error"]
+
+    backend.create = create
+    clock.now += CACHE_RETRY_AFTER
+    assert cached_model(backend, registry, clock) is not None
+    assert backend.created == 1
+
+
+def test_transient_refresh_error_keeps_the_registered_cache(backend, clock):
+    registry = {}
+    first = cached_model(backend, registry, clock)
+    clock.now += CACHE_TTL - CACHE_REFRESH_MARGIN + timedelta(seconds=1)
+
+    def flaky_refresh(handle, ttl):
+        raise ServiceUnavailable("try again")
+
+    refresh = backend.refresh
+    backend.refresh = flaky_refresh
+    with pytest.raises(ServiceUnavailable):
+        cached_model(backend, registry, clock)
+
+    backend.refresh = refresh
+    second = cached_model(backend, registry, clock)
+    assert backend.created == 1
+    assert first.cached_content == second.cached_content
@@ -0,0 +1,43 @@
+import pytest
+
+from model_router import (
+    FAST_MODEL,
+    FakeChat,
+    benchmark_hedging,
+    hedged_send,
+    route_model,
+)
+
+
+class FailingChat:
+    def send_message(self, content, stream=False, request_options=None):
+        raise RuntimeError("boom")
+
+
+def test_route_model_rules_and_targets():
+    assert route_model("你好", True, "", 5.0, 2.0) == ("gemini-1.5-pro", "含圖片")
+    assert route_model("長" * 501, False, "", 5.0, 2.0) == ("gemini-1.5-pro", "長提問")
+    assert route_model("你好", True, "", 2.0, 2.0)[0] == FAST_MODEL
+    assert route_model("你好", False, "", 5.0, 2.0) == (FAST_MODEL, "預設")
+
+
+def test_hedged_send_falls_back_when_primary_fails():
+    chats = lambda name: FailingChat() if name == "primary" else FakeChat(FAST_MODEL, time_scale=0.001)
+    replies = list(hedged_send(chats, "primary", FAST_MODEL, ["你好"], deadline=10))
+
+    assert {model for model, _text in replies} == {FAST_MODEL}
+    assert "你好" in "".join(text for _model, text in replies)
+
+
+def test_hedged_send_raises_when_no_backup():
+    with pytest.raises(RuntimeError):
+        list(hedged_send(lambda name: FailingChat(), "primary", None, ["你好"], deadline=1))
+
+
+def test_hedging_cuts_tail_latency():
+    plain = benchmark_hedging(turns=40, seed=1, hedge=False)
+    hedged = benchmark_hedging(turns=40, seed=1, hedge=True)
+
+    assert plain["backup_rate"] == 0
+    assert 0 < hedged["backup_rate"] < 0.5
+    assert hedged["p99"] < plain["p99"]
@@ -0,0 +1,38 @@
+import time
+
+import streaming_tts
+from streaming_tts import StreamingSpeaker
+
+
+def test_speaks_complete_sentences_in_order(monkeypatch):
+    played = []
+
+    def slow_first(text, language_tld):
+        # 第一句合成較慢，仍必須最先播放
+        if text.startswith("汪"):
+            time.sleep(0.05)
+        return text
+
+    monkeypatch.setattr(streaming_tts, "synthesize_speech", slow_first)
+    monkeypatch.setattr(streaming_tts, "play_audio_queued", played.append)
+
+    speaker = StreamingSpeaker("com.tw")
+    for chunk in ["汪！主人你好", "呀！今天天氣", "很好。我們去散", "步吧？ 3.5 公里. ok", "...", "尾巴"]:
+        speaker.feed(chunk)
+    speaker.finish()
+
+    assert played == ["汪！主人你好呀！", "今天天氣很好。", "我們去散步吧？", "3.5 公里.", "ok...尾巴"]
+    assert speaker.first_audio_latency is not None
+
+
+def test_punctuation_only_reply_plays_nothing(monkeypatch):
+    played = []
+    monkeypatch.setattr(streaming_tts, "synthesize_speech", lambda text, language_tld: text)
+    monkeypatch.setattr(streaming_tts, "play_audio_queued", played.append)
+
+    speaker = StreamingSpeaker("com.tw")
+    speaker.feed("……！？")
+    speaker.finish()
+
+    assert played == []
+    assert speaker.first_audio_latency is None
@@ -1,5 +1,17 @@
 import streamlit as st
 import google.generativeai as genai
+from google.api_core.exceptions import NotFound, PermissionDenied
+import os
+from gemini_cache import (
+    FakeCacheBackend,
+    GeminiCacheBackend,
+    CACHE_MIN_TOKENS,
+    CACHE_RETRY_AFTER,
+    build_uncached_model,
+    cache_entry,
+    drop_cached_model,
+    get_cached_model,
+)
 
 # --- 1. 網頁基礎配置 ---
 st.set_page_config(
@@ -8,6 +20,18 @@ st.set_page_config(
     layout="centered"
 )
 
+# --- 伺服器端快取 (Context Caching) ---
+@st.cache_resource
+def get_cache_backend():
+    if os.environ.get("GEMINI_FAKE_CACHE"):
+        return FakeCacheBackend()
+    return GeminiCacheBackend()
+
+# 本地登記表：(API Key 雜湊, 模型, 角色雜湊) -> 快取代號與到期時間，跨 session 共用
+@st.cache_resource
+def get_cache_registry():
+    return {}
+
 # --- 2. 設定側邊欄 (Sidebar) ---
 # 使用 st.sidebar 將所有元件直接附加到側邊欄上
 # 這樣可以確保 persona_prompt 等變數在主程式碼範圍內可用
@@ -65,6 +89,17 @@ model_name = st.sidebar.selectbox(
     ("gemini-2.5-flash", "gemini-2.5-pro")
 )
 
+# 伺服器端快取設定
+st.sidebar.subheader("伺服器端快取")
+cache_enabled = st.sidebar.toggle("快取角色描述 (Context Caching)", value=True)
+reference_files = st.sidebar.file_uploader(
+    "共用參考文件 (選填)",
+    type=["txt", "md"],
+    accept_multiple_files=True,
+    help="上傳的文件會與角色描述一起登記在快取中，供每一輪對話引用。"
+)
+reference_documents = [f.getvalue().decode("utf-8") for f in reference_files or []]
+
 
 # --- 3. 主應用程式介面 ---
 st.title("🤖 AI 角色對話產生器")
@@ -80,10 +115,31 @@ elif not persona_prompt.strip():
 else:
     try:
         genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(
-            model_name=model_name,
-            system_instruction=persona_prompt
-        )
+        model = None
+        if cache_enabled:
+            try:
+                model = get_cached_model(
+                    get_cache_backend(), get_cache_registry(),
+                    api_key, model_name, persona_prompt, reference_documents
+                )
+            except Exception as e:
+                st.sidebar.warning(f"延長快取失敗，本輪改用一般模式：{e}")
+            entry = cache_entry(get_cache_registry(), api_key, model_name, persona_prompt, reference_documents)
+            if model is None and entry is not None and entry["error"]:
+                retry_minutes = int(CACHE_RETRY_AFTER.total_seconds() // 60)
+                st.sidebar.warning(f"建立快取失敗，{retry_minutes} 分鐘內改用一般模式：{entry['error']}")
+            elif model is None and entry is not None and entry["tokens"] is not None:
+                # 內容低於模型的快取門檻 (例如預設的「旺財」角色描述)，快取不會生效
+                st.sidebar.caption(
+                    f"ℹ️ 角色描述與參考文件約 {entry['tokens']} token，低於 {model_name} 的快取門檻 "
+                    f"{CACHE_MIN_TOKENS.get(model_name, 4096)} token，目前未使用快取，每輪照常計費。"
+                    "上傳共用參考文件讓內容超過門檻後才會啟用。"
+                )
+        using_cache = model is not None
+        if model is None:
+            model = build_uncached_model(model_name, persona_prompt, reference_documents)
+        else:
+            st.sidebar.caption("✅ 角色描述已使用伺服器端快取")
         chat = model.start_chat(history=[])
         st.success("模型已成功載入！可以開始對話了。")
     except Exception as e:
@@ -114,9 +170,21 @@ if prompt := st.chat_input("您想對 AI 說些什麼？"):
             message_placeholder.markdown("思考中...✍️")
             try:
                 # 傳送訊息給模型
-                response = chat.send_message(prompt)
+                try:
+                    response = chat.send_message(prompt)
+                except (NotFound, PermissionDenied):
+                    if not using_cache:
+                        raise
+                    # 伺服器端的快取已被刪除或過期：移除登記並改用一般模式重送，下一輪會重新建立快取
+                    drop_cached_model(get_cache_registry(), api_key, model_name, persona_prompt, reference_documents)
+                    chat = build_uncached_model(model_name, persona_prompt, reference_documents).start_chat(history=[])
+                    response = chat.send_message(prompt)
                 full_response = response.text
                 message_placeholder.markdown(full_response)
+                usage = getattr(response, "usage_metadata", None)
+                if usage is not None:
+                    cached_tokens = getattr(usage, "cached_content_token_count", 0)
+                    st.caption(f"輸入 token：{usage.prompt_token_count} (其中快取 {cached_tokens})")
             except Exception as e:
                 full_response = f"發生錯誤：{e}"
                 message_placeholder.error(full_response)
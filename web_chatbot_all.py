@@ -1,10 +1,9 @@
 import streamlit as st
 import google.generativeai as genai
-from gtts import gTTS
-from PIL import Image
 # 不再需要 from streamlit_camera import camera_input
-import io
-import base64
+from collections import deque
+from streaming_tts import StreamingSpeaker
+from camera_frames import RECENT_FRAMES, load_capture, model_part
 
 # --- 1. 網頁基礎配置 ---
 st.set_page_config(
@@ -13,23 +12,6 @@ st.set_page_config(
     layout="centered"
 )
 
-# --- 語音生成與自動播放函數 ---
-def text_to_speech_autoplay(text: str, language_tld: str):
-    try:
-        tts = gTTS(text=text, lang='zh-TW', tld=language_tld, slow=False)
-        audio_fp = io.BytesIO()
-        tts.write_to_fp(audio_fp)
-        audio_fp.seek(0)
-        audio_base64 = base64.b64encode(audio_fp.read()).decode('utf-8')
-        audio_html = f"""
-        <audio autoplay>
-            <source src="data:audio/mp3;base64,{audio_base64}" type="audio/mpeg">
-        </audio>
-        """
-        st.components.v1.html(audio_html, height=0)
-    except Exception as e:
-        st.error(f"語音生成失敗：{e}")
-
 # --- 2. 設定側邊欄 (Sidebar) ---
 st.sidebar.header("⚙️ 核心設定")
 
@@ -100,46 +82,68 @@ with tab2:
         key="camera_input",
         label_visibility="collapsed"
     )
-
-if "image_data" not in st.session_state:
-    st.session_state.image_data = None
-
-if camera_photo:
-    st.session_state.image_data = Image.open(camera_photo)
-elif uploaded_image:
-    st.session_state.image_data = Image.open(uploaded_image)
-
-if st.session_state.image_data:
-    st.image(st.session_state.image_data, caption="已載入圖片", width=200)
+    attach_recent = st.checkbox(f"提問時附上最近的 {RECENT_FRAMES} 張照片 (多圖比較)", value=False)
+
+if "image_frame" not in st.session_state:
+    st.session_state.image_frame = None
+if "image_reused" not in st.session_state:
+    st.session_state.image_reused = False
+if "seen_file_ids" not in st.session_state:
+    st.session_state.seen_file_ids = {}
+if "recent_frames" not in st.session_state:
+    st.session_state.recent_frames = deque(maxlen=RECENT_FRAMES)
+
+# 只有新的拍照或上傳才會被附加到下一個提問 (拍照優先)
+for source, uploaded_file in (("upload", uploaded_image), ("camera", camera_photo)):
+    frame, reused = load_capture(source, uploaded_file, st.session_state.seen_file_ids, st.session_state.recent_frames)
+    if frame is not None:
+        st.session_state.image_frame = frame
+        st.session_state.image_reused = reused
+
+if st.session_state.image_frame:
+    st.image(st.session_state.image_frame["image"], caption="已載入圖片", width=200)
+    if st.session_state.image_reused:
+        st.caption("新照片與上一張幾乎相同，沿用上一張照片 (不重新上傳)。")
 
 # --- 6. 處理使用者輸入與模型互動 ---
 if prompt := st.chat_input("請輸入文字或載入圖片後提問..."):
     if chat:
+        if attach_recent and st.session_state.recent_frames:
+            attached_frames = list(st.session_state.recent_frames)
+        elif st.session_state.image_frame:
+            attached_frames = [st.session_state.image_frame]
+        else:
+            attached_frames = []
+        attached_images = [frame["image"] for frame in attached_frames]
         user_message_to_display = {"role": "user", "content": prompt}
-        if st.session_state.image_data:
-             user_message_to_display["image"] = st.session_state.image_data
+        if attached_images:
+             user_message_to_display["image"] = attached_images
         
         st.session_state.messages.append(user_message_to_display)
         with st.chat_message("user"):
-            if st.session_state.image_data:
-                st.image(st.session_state.image_data, width=200)
+            if attached_images:
+                st.image(attached_images, width=200)
             st.markdown(prompt)
 
-        model_input = [prompt]
-        if st.session_state.image_data:
-            model_input.append(st.session_state.image_data)
+        model_input = [prompt] + [model_part(frame) for frame in attached_frames]
         
-        st.session_state.image_data = None 
+        st.session_state.image_frame = None 
         
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
             message_placeholder.markdown("思考中...✍️")
             try:
-                response = chat.send_message(model_input)
-                full_response = response.text
+                response = chat.send_message(model_input, stream=True)
+                speaker = StreamingSpeaker(selected_voice_tld) if tts_enabled else None
+                full_response = ""
+                for chunk in response:
+                    full_response += chunk.text
+                    message_placeholder.markdown(full_response + "▌")
+                    if speaker:
+                        speaker.feed(chunk.text)
                 message_placeholder.markdown(full_response)
-                if tts_enabled:
-                    text_to_speech_autoplay(full_response, selected_voice_tld)
+                if speaker:
+                    speaker.finish()
             except Exception as e:
                 full_response = f"發生錯誤：{e}"
                 message_placeholder.error(full_response)
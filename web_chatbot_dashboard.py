@@ -0,0 +1,134 @@
+import streamlit as st
+import sqlite3
+import pandas as pd
+
+# --- 1. 資料庫設定 ---
+# 與 web_chatbot_database.py 共用同一個資料庫，只讀取預先彙總的統計表，
+# 不掃描 conversations 全表，因此無論紀錄多少筆都能即時顯示。
+DB_NAME = "chat_history.db"
+
+@st.cache_resource
+def get_db_connection():
+    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
+    return conn
+
+def load_rollups(granularity, since_bucket):
+    conn = get_db_connection()
+    return pd.read_sql_query("""
+        SELECT r.bucket, r.model, r.persona_hash, COALESCE(p.excerpt, r.persona_hash) AS persona,
+               r.user_messages, r.assistant_messages, r.assistant_chars,
+               r.errors, r.images, r.tts
+        FROM usage_rollups r
+        LEFT JOIN personas p ON p.persona_hash = r.persona_hash
+        WHERE r.granularity = ? AND r.bucket >= ?
+        ORDER BY r.bucket ASC
+    """, conn, params=(granularity, since_bucket))
+
+def load_active_sessions(granularity, since_bucket, models, persona_hashes, group_by=()):
+    """依 group_by 欄位分組的不重複 session 數。
+
+    直接從 session 紀錄計算，切換模型/角色的 session 在同一組內只算一次。
+    """
+    conn = get_db_connection()
+    model_marks = ", ".join("?" * len(models))
+    persona_marks = ", ".join("?" * len(persona_hashes))
+    columns = "".join(f"{column}, " for column in group_by)
+    group_clause = f"GROUP BY {', '.join(group_by)}" if group_by else ""
+    return pd.read_sql_query(f"""
+        SELECT {columns}COUNT(DISTINCT session_id) AS active_sessions
+        FROM usage_rollup_sessions
+        WHERE granularity = ? AND bucket >= ?
+          AND model IN ({model_marks}) AND persona_hash IN ({persona_marks})
+        {group_clause}
+    """, conn, params=(granularity, since_bucket, *models, *persona_hashes))
+
+# --- 2. 網頁基礎配置 ---
+st.set_page_config(
+    page_title="AI 助理使用統計",
+    page_icon="📊",
+    layout="wide"
+)
+
+# --- 3. 側邊欄 (Sidebar) ---
+st.sidebar.header("⚙️ 統計設定")
+granularity_options = {"每日": "day", "每小時": "hour"}
+granularity_label = st.sidebar.radio("時間粒度", list(granularity_options.keys()))
+granularity = granularity_options[granularity_label]
+days = st.sidebar.slider("顯示最近幾天", min_value=1, max_value=90, value=14)
+since = pd.Timestamp.now().normalize() - pd.Timedelta(days=days - 1)
+since_bucket = since.strftime("%Y-%m-%d")
+
+# --- 4. 主應用程式介面 ---
+st.title("📊 AI 助理使用統計")
+st.caption("資料來自訊息寫入時增量更新的彙總表 (usage_rollups)")
+
+try:
+    df = load_rollups(granularity, since_bucket)
+except Exception as e:
+    st.error(f"讀取統計資料失敗 (請先執行 web_chatbot_database.py 建立資料表)：{e}")
+    st.stop()
+
+if df.empty:
+    st.info("目前沒有任何統計資料。")
+    st.stop()
+
+models = sorted(df["model"].unique())
+personas = sorted(df["persona"].unique())
+selected_models = st.sidebar.multiselect("模型", models, default=models)
+selected_personas = st.sidebar.multiselect("角色", personas, default=personas)
+df = df[df["model"].isin(selected_models) & df["persona"].isin(selected_personas)]
+selected_model_names = list(df["model"].unique())
+selected_persona_hashes = list(df["persona_hash"].unique())
+
+# 總覽指標
+total_user = int(df["user_messages"].sum())
+total_assistant = int(df["assistant_messages"].sum())
+total_errors = int(df["errors"].sum())
+avg_length = df["assistant_chars"].sum() / total_assistant if total_assistant else 0
+error_rate = total_errors / (total_assistant + total_errors) if (total_assistant + total_errors) else 0
+
+col1, col2, col3, col4, col5, col6 = st.columns(6)
+col1.metric("訊息數", total_user + total_assistant)
+# 以每日的 session 紀錄計算，不受時間粒度影響
+total_sessions = load_active_sessions("day", since_bucket, selected_model_names, selected_persona_hashes)
+col2.metric("活躍 session", int(total_sessions["active_sessions"].iloc[0]))
+col3.metric("平均回覆長度", f"{avg_length:.0f} 字")
+col4.metric("錯誤率", f"{error_rate:.1%}")
+col5.metric("圖片提問", int(df["images"].sum()))
+col6.metric("語音輸出", int(df["tts"].sum()))
+
+# 依時間區間彙總的趨勢圖
+by_bucket = df.groupby("bucket")[
+    ["user_messages", "assistant_messages", "assistant_chars", "errors", "images", "tts"]
+].sum()
+by_bucket["active_sessions"] = load_active_sessions(
+    granularity, since_bucket, selected_model_names, selected_persona_hashes, group_by=("bucket",)
+).set_index("bucket")["active_sessions"].reindex(by_bucket.index, fill_value=0)
+by_bucket["messages"] = by_bucket["user_messages"] + by_bucket["assistant_messages"]
+by_bucket["avg_response_length"] = (
+    by_bucket["assistant_chars"] / by_bucket["assistant_messages"].where(by_bucket["assistant_messages"] > 0)
+).fillna(0)
+by_bucket["error_rate"] = (
+    by_bucket["errors"] / (by_bucket["assistant_messages"] + by_bucket["errors"]).where(
+        (by_bucket["assistant_messages"] + by_bucket["errors"]) > 0)
+).fillna(0)
+
+st.subheader("訊息數與活躍 session")
+st.line_chart(by_bucket[["messages", "active_sessions"]])
+st.subheader("平均回覆長度")
+st.line_chart(by_bucket[["avg_response_length"]])
+st.subheader("錯誤率")
+st.line_chart(by_bucket[["error_rate"]])
+st.subheader("圖片與語音使用次數")
+st.bar_chart(by_bucket[["images", "tts"]])
+
+# 依模型與角色分組的明細
+st.subheader("依模型 / 角色分組")
+by_group = df.groupby(["model", "persona_hash", "persona"])[
+    ["user_messages", "assistant_messages", "assistant_chars", "errors", "images", "tts"]
+].sum().reset_index()
+group_sessions = load_active_sessions(
+    "day", since_bucket, selected_model_names, selected_persona_hashes, group_by=("model", "persona_hash")
+)
+by_group = by_group.merge(group_sessions, on=["model", "persona_hash"], how="left").drop(columns="persona_hash")
+st.dataframe(by_group, use_container_width=True)
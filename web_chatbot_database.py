@@ -1,13 +1,23 @@
 import streamlit as st
 import google.generativeai as genai
-from gtts import gTTS
-from PIL import Image
 import sqlite3
 import pandas as pd
 from datetime import datetime
 import uuid
-import io
-import base64
+import hashlib
+import time
+from collections import deque
+from streaming_tts import StreamingSpeaker
+from camera_frames import RECENT_FRAMES, load_capture, model_part
+from model_router import (
+    AUTO_ROUTE,
+    FAST_MODEL,
+    HEDGE_LATENCY_FACTOR,
+    MODEL_PROFILES,
+    hedged_send,
+    make_chat,
+    route_model,
+)
 
 # --- 1. 資料庫設定 ---
 DB_NAME = "chat_history.db"
@@ -30,16 +40,133 @@ def init_db():
             timestamp DATETIME NOT NULL
         )
     """)
+    # 預先彙總的統計表 (每小時 / 每日，依模型與角色分組)，隨訊息寫入時增量更新
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS usage_rollups (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            model TEXT NOT NULL,
+            persona_hash TEXT NOT NULL,
+            user_messages INTEGER NOT NULL DEFAULT 0,
+            assistant_messages INTEGER NOT NULL DEFAULT 0,
+            assistant_chars INTEGER NOT NULL DEFAULT 0,
+            errors INTEGER NOT NULL DEFAULT 0,
+            images INTEGER NOT NULL DEFAULT 0,
+            tts INTEGER NOT NULL DEFAULT 0,
+            active_sessions INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularity, bucket, model, persona_hash)
+        )
+    """)
+    # 記錄每個時間區間內出現過的 session，用來增量計算活躍 session 數
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS usage_rollup_sessions (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            model TEXT NOT NULL,
+            persona_hash TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            PRIMARY KEY (granularity, bucket, model, persona_hash, session_id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS personas (
+            persona_hash TEXT PRIMARY KEY,
+            excerpt TEXT NOT NULL
+        )
+    """)
+    conn.commit()
+    backfill_rollups()
+
+ROLLUP_GRANULARITIES = {"hour": "%Y-%m-%d %H:00", "day": "%Y-%m-%d"}
+UNKNOWN = "unknown"
+
+def persona_key(persona_prompt):
+    """回傳角色描述的短雜湊，作為統計表 (usage_rollups、personas) 的鍵值。"""
+    if not persona_prompt:
+        return UNKNOWN
+    return hashlib.sha256(persona_prompt.strip().encode("utf-8")).hexdigest()[:12]
+
+def _update_rollups(cursor, timestamp, session_id, model, persona_hash,
+                    user_messages=0, assistant_messages=0, assistant_chars=0,
+                    errors=0, images=0, tts=0):
+    for granularity, fmt in ROLLUP_GRANULARITIES.items():
+        bucket = timestamp.strftime(fmt)
+        key = (granularity, bucket, model, persona_hash)
+        cursor.execute(
+            "INSERT OR IGNORE INTO usage_rollup_sessions "
+            "(granularity, bucket, model, persona_hash, session_id) VALUES (?, ?, ?, ?, ?)",
+            key + (session_id,)
+        )
+        new_session = cursor.rowcount == 1
+        cursor.execute("""
+            INSERT INTO usage_rollups (granularity, bucket, model, persona_hash,
+                user_messages, assistant_messages, assistant_chars, errors, images, tts, active_sessions)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (granularity, bucket, model, persona_hash) DO UPDATE SET
+                user_messages = user_messages + excluded.user_messages,
+                assistant_messages = assistant_messages + excluded.assistant_messages,
+                assistant_chars = assistant_chars + excluded.assistant_chars,
+                errors = errors + excluded.errors,
+                images = images + excluded.images,
+                tts = tts + excluded.tts,
+                active_sessions = active_sessions + excluded.active_sessions
+        """, key + (user_messages, assistant_messages, assistant_chars,
+                    errors, images, tts, int(new_session)))
+
+def backfill_rollups():
+    """統計表為空時，將既有對話紀錄一次性彙總進去 (模型與角色記為 unknown)。"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if cursor.execute("SELECT 1 FROM usage_rollups LIMIT 1").fetchone():
+        return
+    rows = cursor.execute("SELECT session_id, role, content, timestamp FROM conversations").fetchall()
+    for session_id, role, content, timestamp in rows:
+        timestamp = datetime.fromisoformat(str(timestamp))
+        if role == "user":
+            _update_rollups(cursor, timestamp, session_id, UNKNOWN, UNKNOWN, user_messages=1)
+        else:
+            _update_rollups(cursor, timestamp, session_id, UNKNOWN, UNKNOWN,
+                            assistant_messages=1, assistant_chars=len(content))
     conn.commit()
 
-def log_message_to_db(session_id, role, content):
+def log_message_to_db(session_id, role, content, model=UNKNOWN, persona_prompt=None,
+                      has_image=False, tts=False, update_rollups=True):
     conn = get_db_connection()
     cursor = conn.cursor()
     timestamp = datetime.now()
+    persona_hash = persona_key(persona_prompt)
     cursor.execute(
         "INSERT INTO conversations (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
         (session_id, role, content, timestamp)
     )
+    if persona_prompt:
+        cursor.execute(
+            "INSERT OR IGNORE INTO personas (persona_hash, excerpt) VALUES (?, ?)",
+            (persona_hash, persona_prompt.strip()[:40])
+        )
+    if update_rollups:
+        if role == "user":
+            _update_rollups(cursor, timestamp, session_id, model, persona_hash,
+                            user_messages=1, images=int(has_image))
+        else:
+            _update_rollups(cursor, timestamp, session_id, model, persona_hash,
+                            assistant_messages=1, assistant_chars=len(content), tts=int(tts))
+    conn.commit()
+    return timestamp
+
+def log_user_rollup(session_id, timestamp, model=UNKNOWN, persona_prompt=None, has_image=False):
+    """補上已寫入對話紀錄的使用者訊息統計 (在確定由哪個模型回覆後呼叫)。"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    _update_rollups(cursor, timestamp, session_id, model, persona_key(persona_prompt),
+                    user_messages=1, images=int(has_image))
+    conn.commit()
+
+def log_error_to_db(session_id, model=UNKNOWN, persona_prompt=None):
+    """模型回覆失敗時只更新統計表的錯誤次數，不寫入對話紀錄。"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    _update_rollups(cursor, datetime.now(), session_id, model, persona_key(persona_prompt), errors=1)
     conn.commit()
 
 # --- 2. 網頁基礎配置 ---
@@ -49,20 +176,6 @@ st.set_page_config(
     layout="centered"
 )
 
-# --- 語音生成函數 ---
-def text_to_speech_autoplay(text: str, language_tld: str):
-    try:
-        tts = gTTS(text=text, lang='zh-TW', tld=language_tld, slow=False)
-        audio_fp = io.BytesIO()
-        tts.write_to_fp(audio_fp)
-        audio_fp.seek(0)
-        audio_base64 = base64.b64encode(audio_fp.read()).decode('utf-8')
-        audio_html = f'<audio autoplay><source src="data:audio/mp3;base64,{audio_base64}" type="audio/mpeg"></audio>'
-        st.components.v1.html(audio_html, height=0)
-    except Exception as e:
-        st.error(f"語音生成失敗：{e}")
-
-
 # --- 3. 側邊欄 (Sidebar) ---
 st.sidebar.header("⚙️ 核心設定")
 
@@ -79,7 +192,13 @@ default_persona = "你是一位知識淵博、觀察力敏銳的 AI 助理。"
 st.sidebar.subheader("🎭 角色特性設定")
 persona_prompt = st.sidebar.text_area("請輸入 AI 的角色描述 (System Prompt)：", value=default_persona, height=200)
 
-model_name = st.sidebar.selectbox("選擇模型 (Vision Pro 支援圖片/攝影)", ("gemini-2.5-flash", "gemini-1.5-pro"))
+model_name = st.sidebar.selectbox("選擇模型 (Vision Pro 支援圖片/攝影)", (AUTO_ROUTE, "gemini-2.5-flash", "gemini-1.5-pro"))
+if model_name == AUTO_ROUTE:
+    latency_target = st.sidebar.slider("延遲目標 (秒)", min_value=0.5, max_value=10.0, value=5.0, step=0.5)
+    cost_target = st.sidebar.slider("成本上限 (美元 / 百萬 token)", min_value=0.1, max_value=5.0, value=2.0, step=0.1)
+hedge_enabled = st.sidebar.toggle("啟用備援請求 (逾時改用快速模型)", value=True)
+hedge_factor = st.sidebar.slider("備援等待時間 (主要模型一般延遲的倍數)", min_value=1.0, max_value=5.0,
+                                 value=HEDGE_LATENCY_FACTOR, step=0.5, disabled=not hedge_enabled)
 
 st.sidebar.subheader("🔊 語音設定")
 tts_enabled = st.sidebar.toggle("啟用/關閉語音輸出", value=True)
@@ -129,8 +248,8 @@ if "session_id" not in st.session_state:
 
 # --- 後續程式碼與之前版本完全相同 ---
 
-# 5. 初始化模型與對話
-chat = None
+# 5. 初始化模型與對話 (每一輪由路由決定實際使用的模型)
+chat_ready = False
 if not api_key:
     st.error("⚠️ 請在左側設定您的 Google API Key。")
 elif not persona_prompt.strip():
@@ -138,8 +257,7 @@ elif not persona_prompt.strip():
 else:
     try:
         genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name=model_name, system_instruction=persona_prompt)
-        chat = model.start_chat(history=[])
+        chat_ready = True
         if "messages" not in st.session_state:
              st.success("模型已成功載入！")
     except Exception as e:
@@ -162,48 +280,102 @@ with tab1:
     uploaded_image = st.file_uploader("上傳圖片檔案...", type=["jpg", "jpeg", "png"], label_visibility="collapsed")
 with tab2:
     camera_photo = st.camera_input("點擊按鈕拍照", key="camera_input", label_visibility="collapsed")
+    attach_recent = st.checkbox(f"提問時附上最近的 {RECENT_FRAMES} 張照片 (多圖比較)", value=False)
+
+if "image_frame" not in st.session_state:
+    st.session_state.image_frame = None
+if "image_reused" not in st.session_state:
+    st.session_state.image_reused = False
+if "seen_file_ids" not in st.session_state:
+    st.session_state.seen_file_ids = {}
+if "recent_frames" not in st.session_state:
+    st.session_state.recent_frames = deque(maxlen=RECENT_FRAMES)
 
-if "image_data" not in st.session_state:
-    st.session_state.image_data = None
-if camera_photo:
-    st.session_state.image_data = Image.open(camera_photo)
-elif uploaded_image:
-    st.session_state.image_data = Image.open(uploaded_image)
-if st.session_state.image_data:
-    st.image(st.session_state.image_data, caption="已載入圖片", width=200)
+# 只有新的拍照或上傳才會被附加到下一個提問 (拍照優先)
+for source, uploaded_file in (("upload", uploaded_image), ("camera", camera_photo)):
+    frame, reused = load_capture(source, uploaded_file, st.session_state.seen_file_ids, st.session_state.recent_frames)
+    if frame is not None:
+        st.session_state.image_frame = frame
+        st.session_state.image_reused = reused
+
+if st.session_state.image_frame:
+    st.image(st.session_state.image_frame["image"], caption="已載入圖片", width=200)
+    if st.session_state.image_reused:
+        st.caption("新照片與上一張幾乎相同，沿用上一張照片 (不重新上傳)。")
 
 # 8. 處理使用者輸入與模型互動
 if prompt := st.chat_input("請輸入文字或載入圖片後提問..."):
-    if chat:
+    if chat_ready:
+        if attach_recent and st.session_state.recent_frames:
+            attached_frames = list(st.session_state.recent_frames)
+        elif st.session_state.image_frame:
+            attached_frames = [st.session_state.image_frame]
+        else:
+            attached_frames = []
+        attached_images = [frame["image"] for frame in attached_frames]
+        has_image = bool(attached_frames)
+        if model_name == AUTO_ROUTE:
+            primary_model, route_reason = route_model(prompt, has_image, persona_prompt, latency_target, cost_target)
+        else:
+            primary_model, route_reason = model_name, "手動選擇"
+        backup_model = FAST_MODEL if hedge_enabled and primary_model != FAST_MODEL else None
+        hedge_deadline = hedge_factor * MODEL_PROFILES[primary_model]["latency"]
+
         user_message_to_display = {"role": "user", "content": prompt}
-        if st.session_state.image_data:
-             user_message_to_display["image"] = st.session_state.image_data
+        if attached_images:
+             user_message_to_display["image"] = attached_images
         st.session_state.messages.append(user_message_to_display)
         with st.chat_message("user"):
-            if st.session_state.image_data:
-                st.image(st.session_state.image_data, width=200)
+            if attached_images:
+                st.image(attached_images, width=200)
             st.markdown(prompt)
-        
-        log_message_to_db(st.session_state.session_id, "user", prompt)
 
-        model_input = [prompt]
-        if st.session_state.image_data:
-            model_input.append(st.session_state.image_data)
-        st.session_state.image_data = None 
+        # 對話紀錄立即寫入；統計等確定由哪個模型回覆後才更新，讓同一輪歸屬於同一個模型
+        user_timestamp = log_message_to_db(st.session_state.session_id, "user", prompt, persona_prompt=persona_prompt,
+                                           update_rollups=False)
+
+        model_input = [prompt] + [model_part(frame) for frame in attached_frames]
+        st.session_state.image_frame = None 
         
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
             message_placeholder.markdown("思考中...✍️")
+            answered_model = primary_model
             try:
-                response = chat.send_message(model_input)
-                full_response = response.text
+                started_at = time.monotonic()
+                first_token_latency = None
+                speaker = StreamingSpeaker(selected_voice_tld, started_at) if tts_enabled else None
+                full_response = ""
+                for answered_model, text in hedged_send(
+                    lambda name: make_chat(name, persona_prompt),
+                    primary_model, backup_model, model_input, hedge_deadline
+                ):
+                    if first_token_latency is None:
+                        first_token_latency = time.monotonic() - started_at
+                    full_response += text
+                    message_placeholder.markdown(full_response + "▌")
+                    if speaker:
+                        speaker.feed(text)
                 message_placeholder.markdown(full_response)
-                log_message_to_db(st.session_state.session_id, "assistant", full_response)
-                if tts_enabled:
-                    text_to_speech_autoplay(full_response, selected_voice_tld)
+                total_latency = time.monotonic() - started_at
+                if speaker:
+                    speaker.finish()
+                hedge_note = " (備援模型勝出)" if answered_model != primary_model else ""
+                audio_note = ""
+                if speaker and speaker.first_audio_latency is not None:
+                    audio_note = f"，首段語音 {speaker.first_audio_latency:.2f} 秒"
+                st.caption(f"模型：{answered_model}{hedge_note}｜路由：{route_reason}｜"
+                           f"首字延遲 {first_token_latency or 0:.2f} 秒，文字完成 {total_latency:.2f} 秒{audio_note}")
+                log_message_to_db(st.session_state.session_id, "assistant", full_response, answered_model, persona_prompt,
+                                  tts=speaker is not None and speaker.first_audio_latency is not None)
             except Exception as e:
                 full_response = f"發生錯誤：{e}"
                 message_placeholder.error(full_response)
+                log_error_to_db(st.session_state.session_id, answered_model, persona_prompt)
+            finally:
+                # 使用者按下停止或操作元件時 Streamlit 會拋出非 Exception 的例外，統計仍需補上
+                log_user_rollup(st.session_state.session_id, user_timestamp, answered_model, persona_prompt,
+                                has_image=has_image)
         
         st.session_state.messages.append({"role": "assistant", "content": full_response})
     else: